@@ -1,22 +1,14 @@
-import boto3
-import collections
+import clients
+import concurrent.futures
 import elb
+import functools
+import logging
+import queue
+import threading
 
 
-autoscaling = boto3.client('autoscaling')
-
-
-class lazyproperty(object):
-
-    def __init__(self, function):
-        self._function = function
-
-    def __get__(self, obj, _=None):
-        if obj is None:
-            return self
-        value = self._function(obj)
-        setattr(obj, self._function.__name__, value)
-        return value
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
 
 class AutoScalingGroup(dict):
@@ -25,7 +17,7 @@ class AutoScalingGroup(dict):
     # values then it will not be managed by this module. If the value is
     # blank or any other value, it will be managed. If there is no tag,
     # it will not be managed.
-    DISABLED_TAGS = set((
+    DISABLED_TAGS = frozenset((
         '0',
         'disabled',
         'false',
@@ -35,25 +27,25 @@ class AutoScalingGroup(dict):
 
     # These Auto Scaling processes will be disabled while this module
     # is managing and replacing instances.
-    SCALING_PROCESSES = (
+    SCALING_PROCESSES = frozenset((
         'AlarmNotification',
         'AZRebalance',
         'Launch',
         'ScheduledActions',
-    )
+    ))
 
     # Instance status values used to determine various important states.
     READY_STATUS = 'All:Ready'
-    LAUNCHING_STATUSES = set((
+    LAUNCHING_STATUSES = frozenset((
         'LifecycleState:Pending',
         'LifecycleState:PendingWait',
     ))
-    TERMINATING_STATUSES = set((
+    TERMINATING_STATUSES = frozenset((
         'HealthStatus:Unhealthy',
         'LifecycleState:Terminating',
     ))
 
-    @lazyproperty
+    @functools.cached_property
     def instance_health(self):
         """
         Returns a dictionary of { InstanceId: [ InstanceState ] } using data
@@ -61,19 +53,23 @@ class AutoScalingGroup(dict):
 
         """
 
-        result = collections.defaultdict(list)
+        result = {}
+        for instance in self['Instances']:
+            result[instance['InstanceId']] = []
 
-        for load_balancer_name in self['LoadBalancerNames']:
-            instance_states = elb.describe_instance_health(
-                LoadBalancerName=load_balancer_name,
-            )
+        responses = map_concurrently(
+            elb.describe_load_balancer_health,
+            self['LoadBalancerNames'],
+        )
+        for instance_states in responses:
             for instance_state in instance_states:
                 instance_id = instance_state['InstanceId']
-                result[instance_id].append(instance_state)
+                if instance_id in result:
+                    result[instance_id].append(instance_state)
 
         return result
 
-    @lazyproperty
+    @functools.cached_property
     def instances(self):
         """
         Returns a list of instances in this ASG. The list has helper
@@ -86,7 +82,7 @@ class AutoScalingGroup(dict):
             asg=self,
         )
 
-    @lazyproperty
+    @functools.cached_property
     def is_managed(self):
         """
         Returns a boolean indicating whether the ASG has instance replacement
@@ -94,14 +90,16 @@ class AutoScalingGroup(dict):
 
         """
 
+        tag_values = {}
         for tag in self['Tags']:
-            if tag['Key'] == 'InstanceReplacement':
-                if tag['Value'].lower() in self.DISABLED_TAGS:
-                    return False
-                return True
-        return False
+            tag_values[tag['Key']] = tag['Value']
+
+        value = tag_values.get('InstanceReplacement')
+        if value is None or value.lower() in self.DISABLED_TAGS:
+            return False
+        return True
 
-    @lazyproperty
+    @functools.cached_property
     def is_suspend_processes_required(self):
         """
         Returns a boolean indicating whether scaling processes need
@@ -110,15 +108,37 @@ class AutoScalingGroup(dict):
         """
 
         if self.instances.old:
-            suspended_processes = set()
-            for process in self['SuspendedProcesses']:
-                suspended_processes.add(process['ProcessName'])
-            for process in self.SCALING_PROCESSES:
-                if process not in suspended_processes:
-                    return True
+            if self.SCALING_PROCESSES - self._suspended_process_names:
+                return True
         return False
 
-    @lazyproperty
+    @functools.cached_property
+    def _status_by_id(self):
+        """
+        Returns a dictionary of { InstanceId: status } for all instances
+        in this ASG.
+
+        """
+
+        result = {}
+        for instance in self['Instances']:
+            instance_id = instance['InstanceId']
+            result[instance_id] = self._compute_instance_status(instance)
+        return result
+
+    @functools.cached_property
+    def _suspended_process_names(self):
+        """
+        Returns a set of the names of currently suspended processes.
+
+        """
+
+        result = set()
+        for process in self['SuspendedProcesses']:
+            result.add(process['ProcessName'])
+        return result
+
+    @functools.cached_property
     def target_health(self):
         """
         Returns a dictionary of { InstanceId: [ TargetHealthDescription ] }
@@ -126,31 +146,70 @@ class AutoScalingGroup(dict):
 
         """
 
-        result = collections.defaultdict(list)
+        result = {}
+        for instance in self['Instances']:
+            result[instance['InstanceId']] = []
+
+        # Only instances that are in service and healthy have a status that
+        # depends on target health, see _compute_instance_status().
 
-        targets = []
+        checked_ids = set()
         for instance in self['Instances']:
-            targets.append({
-                'Id': instance['InstanceId'],
-            })
-
-        for target_group_arn in self['TargetGroupARNs']:
-            target_health_descriptions = elb.describe_target_health(
-                TargetGroupArn=target_group_arn,
-                Targets=targets,
-            )
+            if instance.get('LifecycleState') != 'InService':
+                continue
+            if instance.get('HealthStatus') != 'Healthy':
+                continue
+            checked_ids.add(instance['InstanceId'])
+
+        def get_target_group_health(target_group_arn):
+
+            # Get the health of all registered targets. This is cached and
+            # shared with other ASGs using the same target group.
+
+            descriptions = []
+            for description in elb.describe_target_group_health(
+                target_group_arn,
+            ):
+                if description['Target']['Id'] in result:
+                    descriptions.append(description)
+
+            # Instances that are not registered are only included if they
+            # are explicitly specified, so check for any that are missing.
+            # This is rare because instances are registered before they are
+            # in service.
+
+            registered_ids = set()
+            for description in descriptions:
+                registered_ids.add(description['Target']['Id'])
+
+            targets = []
+            for instance_id in sorted(checked_ids - registered_ids):
+                targets.append({
+                    'Id': instance_id,
+                })
+
+            if targets:
+                descriptions.extend(elb.describe_target_health(
+                    TargetGroupArn=target_group_arn,
+                    Targets=targets,
+                ))
+
+            return descriptions
+
+        responses = map_concurrently(
+            get_target_group_health,
+            self['TargetGroupARNs'],
+        )
+        for target_health_descriptions in responses:
             for target_health_description in target_health_descriptions:
                 instance_id = target_health_description['Target']['Id']
                 result[instance_id].append(target_health_description)
 
         return result
 
-    def get_instance_status(self, instance):
+    def _compute_instance_status(self, instance):
         """
-        Returns a string indicating the overall instance status. This is in
-        the form of "Field:Value" and can come from data in the ASG or related
-        Target Groups. If the instance is healthy and in service then the
-        READY_STATUS constant value is returned.
+        Determines the status of an instance. See get_instance_status().
 
         """
 
@@ -164,25 +223,41 @@ class AutoScalingGroup(dict):
 
         instance_id = instance['InstanceId']
 
-        for desc in self.target_health[instance_id]:
-            state = desc['TargetHealth']['State']
-            if state != 'healthy':
-                reason = desc['TargetHealth']['Reason']
-                return 'TargetHealth:{}'.format(reason)
+        # Only look up health details if the ASG has target groups
+        # or load balancers attached.
 
-        for state in self.instance_health[instance_id]:
-            if state['State'] != 'InService':
-                return 'InstanceHealth:{}'.format(state['ReasonCode'])
+        if self['TargetGroupARNs']:
+            for desc in self.target_health[instance_id]:
+                state = desc['TargetHealth']['State']
+                if state != 'healthy':
+                    reason = desc['TargetHealth']['Reason']
+                    return 'TargetHealth:{}'.format(reason)
+
+        if self['LoadBalancerNames']:
+            for state in self.instance_health[instance_id]:
+                if state['State'] != 'InService':
+                    return 'InstanceHealth:{}'.format(state['ReasonCode'])
 
         return self.READY_STATUS
 
+    def get_instance_status(self, instance):
+        """
+        Returns a string indicating the overall instance status. This is in
+        the form of "Field:Value" and can come from data in the ASG or related
+        Target Groups. If the instance is healthy and in service then the
+        READY_STATUS constant value is returned.
+
+        """
+
+        return self._status_by_id[instance['InstanceId']]
+
     def increase_desired_capacity(self):
         """
         Increases the desired capacity by 1.
 
         """
 
-        response = autoscaling.update_auto_scaling_group(
+        response = clients.get('autoscaling').update_auto_scaling_group(
             AutoScalingGroupName=self['AutoScalingGroupName'],
             DesiredCapacity=self['DesiredCapacity'] + 1,
         )
@@ -191,12 +266,12 @@ class AutoScalingGroup(dict):
 
     def log(self, message, *args):
         """
-        Prints a message with the ASG name prefixed.
+        Logs a message with the ASG name prefixed.
 
         """
 
         prefix = '[{}] '.format(self['AutoScalingGroupName'])
-        print(prefix + message.format(*args))
+        logger.info(prefix + message.format(*args))
 
     def resume_processes(self, scaling_processes=None):
         """
@@ -211,7 +286,7 @@ class AutoScalingGroup(dict):
         if scaling_processes:
             kwargs['ScalingProcesses'] = scaling_processes
 
-        response = autoscaling.resume_processes(**kwargs)
+        response = clients.get('autoscaling').resume_processes(**kwargs)
         if response['ResponseMetadata']['HTTPStatusCode'] != 200:
             raise Exception('ERROR: {}'.format(response))
 
@@ -221,7 +296,7 @@ class AutoScalingGroup(dict):
 
         """
 
-        response = autoscaling.set_instance_health(
+        response = clients.get('autoscaling').set_instance_health(
             InstanceId=instance['InstanceId'],
             HealthStatus='Unhealthy',
             ShouldRespectGracePeriod=False,
@@ -236,25 +311,25 @@ class AutoScalingGroup(dict):
 
         """
 
-        response = autoscaling.suspend_processes(
+        response = clients.get('autoscaling').suspend_processes(
             AutoScalingGroupName=self['AutoScalingGroupName'],
-            ScalingProcesses=self.SCALING_PROCESSES,
+            ScalingProcesses=sorted(self.SCALING_PROCESSES),
         )
         if response['ResponseMetadata']['HTTPStatusCode'] != 200:
             raise Exception('ERROR: {}'.format(response))
 
 
-class InstanceList(collections.UserList):
+class InstanceList(list):
     """
     A list of instances with helper properties for filtering.
 
     """
 
     def __init__(self, instances, asg):
-        self.data = instances
+        super().__init__(instances)
         self.asg = asg
 
-    @lazyproperty
+    @functools.cached_property
     def launching(self):
         instances = []
         for instance in self:
@@ -263,7 +338,7 @@ class InstanceList(collections.UserList):
                 instances.append(instance)
         return self.__class__(instances, self.asg)
 
-    @lazyproperty
+    @functools.cached_property
     def new(self):
         instances = []
         asg_lc = self.asg['LaunchConfigurationName']
@@ -273,7 +348,7 @@ class InstanceList(collections.UserList):
                 instances.append(instance)
         return self.__class__(instances, self.asg)
 
-    @lazyproperty
+    @functools.cached_property
     def old(self):
         instances = []
         asg_lc = self.asg['LaunchConfigurationName']
@@ -283,7 +358,7 @@ class InstanceList(collections.UserList):
                 instances.append(instance)
         return self.__class__(instances, self.asg)
 
-    @lazyproperty
+    @functools.cached_property
     def terminating(self):
         instances = []
         for instance in self:
@@ -292,7 +367,7 @@ class InstanceList(collections.UserList):
                 instances.append(instance)
         return self.__class__(instances, self.asg)
 
-    @lazyproperty
+    @functools.cached_property
     def unready(self):
         instances = []
         for instance in self:
@@ -308,8 +383,22 @@ def describe_auto_scaling_groups(**kwargs):
 
     """
 
-    paginator = autoscaling.get_paginator('describe_auto_scaling_groups')
-    pages = paginator.paginate(**kwargs)
+    client = clients.get('autoscaling')
+    paginator = client.get_paginator('describe_auto_scaling_groups')
+    page_size = 100  # maximum allowed by the API
+    pages = paginator.paginate(
+        PaginationConfig={
+            'PageSize': page_size,
+        },
+        **kwargs
+    )
+
+    # Prefetching only helps if there can be more than one page. Describing
+    # specific ASGs, such as the one from an event, fits in a single page.
+    names = kwargs.get('AutoScalingGroupNames')
+    if not names or len(names) > page_size:
+        pages = prefetch(pages)
+
     for page in pages:
         if page['ResponseMetadata']['HTTPStatusCode'] != 200:
             raise Exception('ERROR: {}'.format(page))
@@ -323,10 +412,76 @@ def describe_auto_scaling_instances(**kwargs):
 
     """
 
-    paginator = autoscaling.get_paginator('describe_auto_scaling_instances')
+    client = clients.get('autoscaling')
+    paginator = client.get_paginator('describe_auto_scaling_instances')
     pages = paginator.paginate(**kwargs)
     for page in pages:
         if page['ResponseMetadata']['HTTPStatusCode'] != 200:
             raise Exception('ERROR: {}'.format(page))
         for instance in page['AutoScalingInstances']:
             yield instance
+
+
+def map_concurrently(function, items, max_workers=16):
+    """
+    Calls a function for each item using a pool of threads, so that
+    multiple API requests can be in flight at the same time. Returns
+    a list of results in the same order as the items.
+
+    """
+
+    items = list(items)
+    if len(items) < 2:
+        return [function(item) for item in items]
+
+    workers = min(max_workers, len(items))
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(function, items))
+
+
+def prefetch(iterable, size=1):
+    """
+    Yields items from an iterable while a background thread fetches the
+    next items. This allows the next page of an API response to be
+    requested while the current page is being processed. The background
+    thread stops if the caller stops consuming items.
+
+    """
+
+    done = object()
+    stop = threading.Event()
+    items = queue.Queue(maxsize=size)
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        error = None
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    break
+        except BaseException as exception:
+            error = exception
+        finally:
+            put((done, error))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                break
+            yield item
+    finally:
+        stop.set()
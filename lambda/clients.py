@@ -0,0 +1,35 @@
+import threading
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get(service_name):
+    """
+    Returns a boto3 client for the specified service. Clients are created
+    when first used, so code paths that never use a service do not pay the
+    cost of creating its client.
+
+    """
+
+    # Creating clients from the default session is not thread safe,
+    # and clients may be first used from multiple threads at once.
+
+    with _lock:
+        if service_name not in _clients:
+            import boto3
+            import botocore.config
+            _clients[service_name] = boto3.client(
+                service_name,
+                config=botocore.config.Config(
+                    # Allow more connections than the default of 10 so
+                    # concurrent requests are not waiting for a connection.
+                    max_pool_connections=32,
+                    retries={
+                        'max_attempts': 3,
+                        'mode': 'adaptive',
+                    },
+                ),
+            )
+        return _clients[service_name]
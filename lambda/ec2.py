@@ -1,18 +1,16 @@
-import boto3
+import clients
 
-ec2 = boto3.client('ec2')
 
-
-def terminate_instance(instance):
+def terminate_instances(instances):
     """
-    Terminates an EC2 instance.
+    Terminates one or more EC2 instances.
 
     """
 
-    instance_id = instance['InstanceId']
+    instance_ids = [instance['InstanceId'] for instance in instances]
 
-    response = ec2.terminate_instances(
-        InstanceIds=[instance_id]
+    response = clients.get('ec2').terminate_instances(
+        InstanceIds=instance_ids
     )
     if response['ResponseMetadata']['HTTPStatusCode'] != 200:
         raise Exception('ERROR: {}'.format(response))
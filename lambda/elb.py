@@ -1,8 +1,16 @@
-import boto3
+import clients
+import functools
 
 
-elb = boto3.client('elb')
-elbv2 = boto3.client('elbv2')
+def clear_cache():
+    """
+    Clears cached load balancer and target group health, so that each
+    invocation of the function sees current data.
+
+    """
+
+    describe_load_balancer_health.cache_clear()
+    describe_target_group_health.cache_clear()
 
 
 def describe_instance_health(**kwargs):
@@ -12,20 +20,48 @@ def describe_instance_health(**kwargs):
 
     """
 
-    response = elb.describe_instance_health(**kwargs)
+    response = clients.get('elb').describe_instance_health(**kwargs)
     if response['ResponseMetadata']['HTTPStatusCode'] != 200:
         raise Exception('ERROR: {}'.format(response))
 
     return response['InstanceStates']
 
 
+@functools.lru_cache(maxsize=None)
+def describe_load_balancer_health(load_balancer_name):
+    """
+    Describes the state of all instances registered with the specified
+    load balancer. Results are cached because multiple ASGs can share
+    the same load balancer.
+
+    """
+
+    return describe_instance_health(
+        LoadBalancerName=load_balancer_name,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def describe_target_group_health(target_group_arn):
+    """
+    Describes the health of all targets registered with the specified
+    target group. Results are cached because multiple ASGs can share
+    the same target group.
+
+    """
+
+    return describe_target_health(
+        TargetGroupArn=target_group_arn,
+    )
+
+
 def describe_target_health(**kwargs):
     """
     Describes the health of the specified targers or all of your targets.
 
     """
 
-    response = elbv2.describe_target_health(**kwargs)
+    response = clients.get('elbv2').describe_target_health(**kwargs)
     if response['ResponseMetadata']['HTTPStatusCode'] != 200:
         raise Exception('ERROR: {}'.format(response))
 
@@ -1,11 +1,25 @@
 import autoscaling
 import ec2
+import elb
 import itertools
+import logging
+
+
+# The Lambda runtime adds a handler to the root logger. This adds one when
+# running anywhere else, so that log messages are not discarded.
+logging.basicConfig()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
 
 def lambda_handler(event, context):
 
-    print('event: {}'.format(event))
+    logger.info('event: {}'.format(event))
+
+    # Health data is cached across ASGs that share load balancers and
+    # target groups, but must not be reused by later invocations.
+    elb.clear_cache()
 
     # If this is an ASG event then it will have an ASG name.
     detail = event['detail']
@@ -49,6 +63,14 @@ def replace_old_instances(asg):
 
     """
 
+    # Finish early if there is nothing to do. Finding old instances only
+    # compares Launch Configuration names, so this avoids any health checks.
+    # The max size must still be enforced, see the "Bad State" below.
+
+    if not asg.instances.old and not asg['SuspendedProcesses']:
+        if len(asg.instances) <= asg['MaxSize']:
+            return
+
     if asg.is_suspend_processes_required:
         asg.log('suspending processes')
         asg.suspend_processes()
@@ -69,24 +91,34 @@ def replace_old_instances(asg):
 
         terminations_required = len(asg.instances) - asg['MaxSize']
 
-        instances_in_termination_order = itertools.chain(
-            asg.instances.terminating,
-            asg.instances.launching,
-            asg.instances.unready,
-            asg.instances.new,
-            asg.instances,
-        )
+        # Rank the instances in the order they should be terminated, checking
+        # each instance only once. Instances that are already terminating come
+        # first, then launching, unready, new, and finally all others.
 
-        terminating_instance_ids = set()
+        asg_lc = asg['LaunchConfigurationName']
+        ranked_instances = []
 
-        for instance in instances_in_termination_order:
+        for instance in asg.instances:
+            status = asg.get_instance_status(instance)
+            if status in asg.TERMINATING_STATUSES:
+                rank = 0
+            elif status in asg.LAUNCHING_STATUSES:
+                rank = 1
+            elif status != asg.READY_STATUS:
+                rank = 2
+            elif instance.get('LaunchConfigurationName') == asg_lc:
+                rank = 3
+            else:
+                rank = 4
+            ranked_instances.append((rank, instance, status))
 
-            instance_id = instance['InstanceId']
+        ranked_instances.sort(key=lambda ranked_instance: ranked_instance[0])
 
-            if instance_id in terminating_instance_ids:
-                continue
+        instances_to_terminate = []
 
-            status = asg.get_instance_status(instance)
+        for _, instance, status in ranked_instances[:terminations_required]:
+
+            instance_id = instance['InstanceId']
 
             if status == 'LifecycleState:Terminating':
                 asg.log(
@@ -100,12 +132,10 @@ def replace_old_instances(asg):
                     instance_id,
                     status,
                 )
-                ec2.terminate_instance(instance)
+                instances_to_terminate.append(instance)
 
-            terminating_instance_ids.add(instance_id)
-
-            if len(terminating_instance_ids) == terminations_required:
-                break
+        if instances_to_terminate:
+            ec2.terminate_instances(instances_to_terminate)
 
         # Next: State C, wait for instance to terminate
 